@@ -1,36 +1,89 @@
-"""Constants to refer to the UUIDs for Ooler characteristics"""
+"""Constants to refer to the UUIDs for Ooler characteristics
+UUIDs are normalised at import time into the same form bleak uses, so they can be
+compared directly with those of the characteristics it discovers.
+"""
 from enum import Enum
 from bleak import uuids
 
-TARGET_TEMP_F = "6aa46711-a29d-4f8a-88e2-044ca1fd03ff"
-ACTUAL_TEMP = "e8ebded3-9dca-45c2-a2d8-ceffb901474d"
-FAN_SPEED = "cafe2421-d04c-458f-b1c0-253c6c97e8e8"
-POWER_STATUS = "7a2623ff-bd92-4c13-be9f-7023aa4ecb85"
-WARM_WAKE_ENABLED = "7aa73db1-1c2d-4c8c-9195-36c0a4b6acb2"
-RELATIVE_HUMIDITY = "654b8162-7090-4084-8d94-4eb33e917e9c"
-AMBIENT_TEMPERATURE_F = "7c0ea228-2616-4765-a726-beb5f4a0fa71"
-WATER_LEVEL = "8db5b9db-dbf6-47e6-a9dd-0612a1349a5b"
-SERIAL_NUMBER = "136e24c6-c486-4a74-bb0a-d18b985970a6"
-NAME = "00002a00-0000-1000-8000-00805f9b34fb"
-CLEAN = "e9bf509a-b1c5-4243-9514-352ad2d851f6"
-DEVICE_LOGS = "e6a505a4-9f0b-4755-b234-13243240da23"
-PUMP_WATTS = "5a914d86-9b5e-4a35-ad3d-3e5936d485b2"
-PUMP_VOLTS = "f30d875a-7297-43ac-9f5b-1d7eed4446eb"
-POWER_RAIL = "acab07ec-fc95-451d-88e5-4565a364a806"
-LIFETIME = "5d30781f-1d06-4790-bbb8-5e1d7da96383"
-RUNTIME = "1a5c6dae-34de-4265-9fa6-0a59f7f683ee"
-UV_RUNTIME = "0ab6ff00-8d1b-475e-bcfa-ed3467f1f890"
-DISPLAY_TEMPERATURE_UNIT = "2c988613-fe15-4067-85bc-8e59d5e0b1e3"
+TARGET_TEMP_F = uuids.normalize_uuid_str("6aa46711-a29d-4f8a-88e2-044ca1fd03ff")
+ACTUAL_TEMP = uuids.normalize_uuid_str("e8ebded3-9dca-45c2-a2d8-ceffb901474d")
+FAN_SPEED = uuids.normalize_uuid_str("cafe2421-d04c-458f-b1c0-253c6c97e8e8")
+POWER_STATUS = uuids.normalize_uuid_str("7a2623ff-bd92-4c13-be9f-7023aa4ecb85")
+WARM_WAKE_ENABLED = uuids.normalize_uuid_str("7aa73db1-1c2d-4c8c-9195-36c0a4b6acb2")
+RELATIVE_HUMIDITY = uuids.normalize_uuid_str("654b8162-7090-4084-8d94-4eb33e917e9c")
+AMBIENT_TEMPERATURE_F = uuids.normalize_uuid_str("7c0ea228-2616-4765-a726-beb5f4a0fa71")
+WATER_LEVEL = uuids.normalize_uuid_str("8db5b9db-dbf6-47e6-a9dd-0612a1349a5b")
+SERIAL_NUMBER = uuids.normalize_uuid_str("136e24c6-c486-4a74-bb0a-d18b985970a6")
+NAME = uuids.normalize_uuid_str("00002a00-0000-1000-8000-00805f9b34fb")
+CLEAN = uuids.normalize_uuid_str("e9bf509a-b1c5-4243-9514-352ad2d851f6")
+DEVICE_LOGS = uuids.normalize_uuid_str("e6a505a4-9f0b-4755-b234-13243240da23")
+PUMP_WATTS = uuids.normalize_uuid_str("5a914d86-9b5e-4a35-ad3d-3e5936d485b2")
+PUMP_VOLTS = uuids.normalize_uuid_str("f30d875a-7297-43ac-9f5b-1d7eed4446eb")
+POWER_RAIL = uuids.normalize_uuid_str("acab07ec-fc95-451d-88e5-4565a364a806")
+LIFETIME = uuids.normalize_uuid_str("5d30781f-1d06-4790-bbb8-5e1d7da96383")
+RUNTIME = uuids.normalize_uuid_str("1a5c6dae-34de-4265-9fa6-0a59f7f683ee")
+UV_RUNTIME = uuids.normalize_uuid_str("0ab6ff00-8d1b-475e-bcfa-ed3467f1f890")
+DISPLAY_TEMPERATURE_UNIT = uuids.normalize_uuid_str(
+    "2c988613-fe15-4067-85bc-8e59d5e0b1e3"
+)
 LOCAL_TIME = uuids.normalize_uuid_str("2A0F")
 CURRENT_TIME = uuids.normalize_uuid_str("2A2B")
 
+ALL_UUIDS = frozenset(
+    (
+        TARGET_TEMP_F,
+        ACTUAL_TEMP,
+        FAN_SPEED,
+        POWER_STATUS,
+        WARM_WAKE_ENABLED,
+        RELATIVE_HUMIDITY,
+        AMBIENT_TEMPERATURE_F,
+        WATER_LEVEL,
+        SERIAL_NUMBER,
+        NAME,
+        CLEAN,
+        DEVICE_LOGS,
+        PUMP_WATTS,
+        PUMP_VOLTS,
+        POWER_RAIL,
+        LIFETIME,
+        RUNTIME,
+        UV_RUNTIME,
+        DISPLAY_TEMPERATURE_UNIT,
+        LOCAL_TIME,
+        CURRENT_TIME,
+    )
+)
+
+# Characteristics describing the current state of the device, which are polled
+# unless the device can notify us of changes
+STATE_UUIDS = (
+    ACTUAL_TEMP,
+    TARGET_TEMP_F,
+    FAN_SPEED,
+    POWER_STATUS,
+    WATER_LEVEL,
+    PUMP_WATTS,
+    PUMP_VOLTS,
+    CLEAN,
+)
+
+# Single-byte characteristic values for booleans
+BOOL_PAYLOAD = (b"\x00", b"\x01")
+
 
 class TemperatureUnit(Enum):
     Fahrenheit = 0
     Celsius = 1
 
 
+TEMPERATURE_UNIT_PAYLOAD = {unit: bytes((unit.value,)) for unit in TemperatureUnit}
+
+
 class FanSpeed(Enum):
     Silent = 0
     Regular = 1
     Boost = 2
+
+
+FAN_SPEED_PAYLOAD = {speed: bytes((speed.value,)) for speed in FanSpeed}
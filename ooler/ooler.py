@@ -1,243 +1,872 @@
 """Monitor and control an Ooler device via Bluetooth Low Energy"""
+import functools
+import glob
+import json
 import logging
-from datetime import datetime
+import math
+import os
+import random
+import struct
+import threading
+import time
+import weakref
+from typing import Dict, List, Optional, Tuple
+from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
 from ooler import constants
 from bleak import BleakClient, BleakError
+from bleak.exc import BleakCharacteristicNotFoundError, BleakDBusError
+from bleak.backends.device import BLEDevice
 import asyncio
 
+# Writing to the key characteristic also changes the values of these
+_INVALIDATES = {
+    constants.DISPLAY_TEMPERATURE_UNIT: (constants.ACTUAL_TEMP,),
+    constants.POWER_STATUS: (constants.PUMP_WATTS, constants.PUMP_VOLTS),
+}
+
+# How long to cache values for, where it should differ from cache_ttl
+_CACHE_TTL = {
+    # These never change during a session
+    constants.NAME: math.inf,
+    constants.SERIAL_NUMBER: math.inf,
+    # This changes slowly, and isn't urgent
+    constants.WATER_LEVEL: 5,
+}
+
+# Errors for a request that was turned down, on a link that is otherwise fine
+_REQUEST_ERRORS: Tuple[type, ...] = (BleakCharacteristicNotFoundError,)
+try:
+    # Newer versions of bleak report ATT errors from the device as their own type
+    from bleak.exc import BleakGATTProtocolError
+except ImportError:
+    pass
+else:
+    _REQUEST_ERRORS += (BleakGATTProtocolError,)
+
+# The same for BlueZ, which reports ATT errors from the device as Failed
+_REQUEST_DBUS_ERRORS = frozenset(
+    {
+        "org.bluez.Error.InvalidArguments",
+        "org.bluez.Error.InvalidOffset",
+        "org.bluez.Error.InvalidValueLength",
+        "org.bluez.Error.NotAuthorized",
+        "org.bluez.Error.NotPermitted",
+        "org.bluez.Error.NotSupported",
+    }
+)
+
+# debugfs knobs for the connection interval (in units of 1.25ms) that the
+# adapter asks for on new connections, used by fast_connection_interval
+_CONNECTION_INTERVAL_DEBUGFS = "/sys/kernel/debug/bluetooth/hci0"
+_FAST_CONNECTION_INTERVAL = (("conn_min_interval", 6), ("conn_max_interval", 12))
+
+# Where we remember which services hold the characteristics we use, per device
+_SERVICE_CACHE_DIR = os.path.join(
+    os.path.expanduser("~"), ".cache", "ooler-mqtt-bridge"
+)
+
+
+def _f_to_c_exact(deg_f: int) -> int:
+    """Convert Fahrenheit to Celsius, integer, by arithmetic"""
+    # round((deg_f - 32) * 5 / 9) without going via floats; the exact result is
+    # never a half, so rounding half up is the same as round()
+    return ((deg_f - 32) * 10 + 9) // 18
+
+
+def _c_to_f_exact(deg_c: int) -> int:
+    """Convert Celsius to Fahrenheit, integer, by arithmetic"""
+    # round(deg_c * 9 / 5 + 32) without going via floats, as above
+    return (deg_c * 18 + 5) // 10 + 32
+
+
+# Every temperature the Ooler can report or be set to converted once up front,
+# which covers far more than its actual range of 55-115F/13-46C
+_F_TO_C = tuple(_f_to_c_exact(deg_f) for deg_f in range(256))
+_C_TO_F_MIN = -40
+_C_TO_F = tuple(_c_to_f_exact(deg_c) for deg_c in range(_C_TO_F_MIN, 128))
+
+
+def _f_to_c(deg_f: int) -> int:
+    """Convert Fahrenheit to Celsius, integer"""
+    if 0 <= deg_f < len(_F_TO_C):
+        return _F_TO_C[deg_f]
+    return _f_to_c_exact(deg_f)
+
+
+def _c_to_f(deg_c: int) -> int:
+    """Convert Celsius to Fahrenheit, integer"""
+    if _C_TO_F_MIN <= deg_c < _C_TO_F_MIN + len(_C_TO_F):
+        return _C_TO_F[deg_c - _C_TO_F_MIN]
+    return _c_to_f_exact(deg_c)
+
+
+def _u8(value: bytes) -> int:
+    """Decode a single byte integer characteristic value
+    All of the integer characteristics we read are a single byte; anything wider
+    will need int.from_bytes instead.
+    """
+    return value[0]
+
+
+def _u8_getter(name: str, uuid: str, doc: str):
+    """Make a getter method of Ooler for a single byte integer characteristic"""
+
+    async def getter(self) -> int:
+        return _u8(await self._request_characteristic(uuid))
+
+    getter.__name__ = name
+    getter.__qualname__ = f"Ooler.{name}"
+    getter.__doc__ = doc
+    return getter
+
+
+def _is_link_error(exc: Exception) -> bool:
+    """Return whether an error means the link is broken, rather than the request
+    Asking again on a new connection would only get the same answer otherwise.
+    """
+    if isinstance(exc, _REQUEST_ERRORS):
+        return False
+    if isinstance(exc, BleakDBusError):
+        return exc.dbus_error not in _REQUEST_DBUS_ERRORS and "ATT error" not in (
+            exc.dbus_error_details or ""
+        )
+    return True
+
+
+def _shared_task(coro) -> asyncio.Task:
+    """Start a task for several callers to wait on through asyncio.shield()
+    Shielding it means one waiter giving up doesn't cancel it for everyone else.
+    That can leave nobody waiting to see it fail, so any failure is marked as
+    seen here.
+    """
+    task = asyncio.create_task(coro)
+    task.add_done_callback(_mark_seen)
+    return task
+
+
+def _mark_seen(task: asyncio.Task) -> None:
+    """Retrieve the exception of a finished task, so asyncio doesn't warn"""
+    if not task.cancelled():
+        task.exception()
+
+
+def _service_cache_path(address: str) -> str:
+    """Return the path of the service cache file for a device"""
+    return os.path.join(_SERVICE_CACHE_DIR, f"{address.replace(':', '_')}.json")
+
+
+class _Connection:
+    """The client for one device, and everything we know about its connection
+    This is shared by every Ooler instance for the device's address, so they all
+    see the same subscriptions and cached values, and a drop by one of them is
+    seen by the rest.
+    """
+
+    def __init__(self, address, services: Optional[List[str]]):
+        self.address = address
+        self.services = services
+        self.client = self.new_client()
+        self.connector: Optional[asyncio.Task] = None
+        self.refcount = 0
+        self.in_flight = 0
+        self.idle_handle: Optional[asyncio.TimerHandle] = None
+        self.idle_disconnect: Optional[asyncio.Task] = None
+        self.dropper: Optional[asyncio.Task] = None
+        self.drops = 0
+        self.pending_reads: Dict[str, asyncio.Task] = {}
+        self.writes: Dict[str, int] = {}
+        self.reset()
+
+    def reset(self) -> None:
+        """Forget everything that only holds for the current connection"""
+        self.characteristics = {}
+        self.write_needs_response: Dict[str, bool] = {}
+        self.value_cache: Dict[str, Tuple[float, bytes]] = {}
+        self.last_written: Dict[str, Tuple[float, bytes]] = {}
+        self.notifying = set()
+
+    def new_client(self) -> BleakClient:
+        """Make a client for the device, limited to our services if we know them"""
+        return BleakClient(
+            self.address,
+            services=self.services,
+            disconnected_callback=self._on_disconnect,
+        )
+
+    def _on_disconnect(self, client: BleakClient) -> None:
+        """Forget what we knew when the link drops, however that happens
+        Otherwise notified values would be trusted long after notifications have
+        stopped, and nothing would prompt a reconnection.
+        """
+        # A client we've since replaced has nothing to do with the connection
+        if client is self.client:
+            self.reset()
+
 
 class Ooler:
     """Control an Ooler device via Bluetooth LE"""
 
-    def __init__(self, address=None, stay_connected=True, max_connection_attempts=30, connection_retry_interval=1):
-        self.address = address
+    # Instances for the same address share one connection, for as long as any of
+    # them is still around. Its client and tasks belong to the event loop that
+    # first used it, so instances shouldn't be shared between event loops.
+    _connections: "weakref.WeakValueDictionary[str, _Connection]" = (
+        weakref.WeakValueDictionary()
+    )
+    _pool_lock = threading.Lock()
+
+    def __init__(
+        self,
+        address=None,
+        stay_connected=True,
+        max_connection_attempts=30,
+        connection_retry_interval=1,
+        cache_ttl=1,
+        retry_deadline=30,
+        max_retry_interval=8,
+        idle_timeout=30,
+        fast_connection_interval=False,
+    ):
+        # Passing a BLEDevice (e.g. from a BleakScanner) rather than an address
+        # saves bleak from having to scan for the device before connecting
+        if isinstance(address, BLEDevice):
+            self.address = address.address
+        else:
+            self.address = address
         self.stay_connected = stay_connected
         self.max_connection_attempts = max_connection_attempts
         self.connection_retry_interval = connection_retry_interval
-        self.client = BleakClient(self.address)
+        self.cache_ttl = cache_ttl
+        self.retry_deadline = retry_deadline
+        self.max_retry_interval = max_retry_interval
+        self.idle_timeout = idle_timeout
+        self.fast_connection_interval = fast_connection_interval
         self.logger = logging.getLogger(__name__)
-        self.logger.setLevel(logging.DEBUG)
+        with Ooler._pool_lock:
+            connection = Ooler._connections.get(self.address)
+            if connection is None:
+                connection = _Connection(address, self._load_services())
+                Ooler._connections[self.address] = connection
+            self._connection = connection
         self.device_temperature_unit = None
-        self.connection_lock = asyncio.Lock()
+        self.device_name = None
+
+    @property
+    def client(self) -> BleakClient:
+        """The client shared by every Ooler instance for this address"""
+        return self._connection.client
+
+    async def __aenter__(self) -> "Ooler":
+        """Connect, and hold the link open until the matching __aexit__"""
+        with Ooler._pool_lock:
+            self._connection.refcount += 1
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        """Disconnect, if this was the last async with block holding the link"""
+        with Ooler._pool_lock:
+            self._connection.refcount -= 1
+        await self.disconnect()
 
     async def connect(self) -> None:
-        """Attempt to connect to the Ooler"""
-        if self.client and self.client.is_connected:
-            return
-
-        async with self.connection_lock:
-            # Check if someone else connected already
-            if self.client and self.client.is_connected:
+        """Attempt to connect to the Ooler
+        This returns straight away if we're already connected, so it's cheap to
+        call before every operation. Concurrent callers all wait on the same
+        connection attempt, rather than queueing up to make their own, and a
+        connection doesn't count until it has been fully set up.
+        """
+        connection = self._connection
+        # Let a drop that's under way finish, rather than connecting underneath it
+        if connection.dropper is not None and not connection.dropper.done():
+            await asyncio.wait((connection.dropper,))
+        if connection.connector is None or connection.connector.done():
+            if self.client.is_connected:
+                return
+            connection.connector = _shared_task(self._do_connect())
+        await asyncio.shield(connection.connector)
+
+    async def _do_connect(self) -> None:
+        """Connect to the Ooler, and set up what we need from the connection"""
+        if self.fast_connection_interval:
+            self._request_fast_connection_interval()
+
+        await self._connect_client()
+        self._cache_characteristics()
+        if self._connection.services is not None and not self._has_state_uuids():
+            # What we remembered is stale, and the client only knows about what
+            # we remembered, so start over with one that discovers everything
+            self.logger.info("Service cache is stale, rediscovering services")
+            self.clear_cache(self.address)
+            await self._replace_client()
+            await self._connect_client()
+            self._cache_characteristics()
+        self._update_service_cache()
+        await self._start_notifications()
+
+    async def _connect_client(self) -> None:
+        """Connect the client, retrying up to max_connection_attempts times"""
+        # Reuse the existing client, so bleak can keep what it already knows
+        # about the device across transient disconnections
+        for attempt in range(self.max_connection_attempts):
+            self.logger.info("Attempting to connect number %d", attempt)
+            try:
+                await self.client.connect()
+                self.logger.info("Connected to %s", self.address)
+                break
+            except BleakError as exc:
+                self.logger.warning(
+                    "Failed to connect on attempt %d, got %r", attempt, exc
+                )
+                # Back off to give the adapter (and the Ooler) time to recover
+                await asyncio.sleep(self._backoff_delay(attempt))
+        else:
+            raise ConnectionError("Failed to connect to Ooler")
+
+    async def _replace_client(self) -> None:
+        """Swap the shared client for one that discovers every service"""
+        connection = self._connection
+        await self.client.disconnect()
+        with Ooler._pool_lock:
+            connection.services = None
+            connection.client = connection.new_client()
+
+    def _request_fast_connection_interval(self) -> None:
+        """Ask the adapter to use a 7.5-15ms connection interval
+        Every GATT operation waits at least one interval, and BlueZ defaults to
+        30-50ms. This only applies to new connections, and needs debugfs and
+        root, so we carry on as normal if it can't be done.
+        """
+        for knob, value in _FAST_CONNECTION_INTERVAL:
+            path = os.path.join(_CONNECTION_INTERVAL_DEBUGFS, knob)
+            try:
+                with open(path, "w", encoding="ascii") as knob_file:
+                    knob_file.write(str(value))
+            except OSError as exc:
+                self.logger.debug("Unable to set %s, got %r", knob, exc)
                 return
 
-            attempt = 0
-            self.client = BleakClient(self.address)
-            while not self.client.is_connected and attempt < self.max_connection_attempts:
-                self.logger.info(f"Attempting to connect number {attempt}")
-                try:
-                    await self.client.connect()
-                    self.logger.info(f"Connected to {self.address}")
-                except BleakError as exc:
-                    self.logger.warning(f"Failed to connect on attempt {attempt}, got {exc}")
-                    await asyncio.sleep(self.connection_retry_interval)
+    def _load_services(self) -> Optional[List[str]]:
+        """Load the services we found last time, to limit discovery to them
+        The GATT layout of the Ooler is static, so there's no need to have every
+        service on the device resolved on every connection.
+        """
+        if self.address is None:
+            return None
+        try:
+            with open(_service_cache_path(self.address), encoding="utf-8") as cache:
+                services = json.load(cache)
+        except (OSError, ValueError):
+            return None
+        return services or None
+
+    def _update_service_cache(self) -> None:
+        """Remember which services hold the characteristics we use
+        If any state characteristics are missing then what we remembered may be
+        stale, so forget it and let the next client discover everything again.
+        """
+        if self.address is None:
+            return
+        if not self._has_state_uuids():
+            self.clear_cache(self.address)
+            return
+        path = _service_cache_path(self.address)
+        if os.path.exists(path):
+            return
+        services = sorted(
+            {char.service_uuid for char in self._connection.characteristics.values()}
+        )
+        try:
+            os.makedirs(_SERVICE_CACHE_DIR, exist_ok=True)
+            with open(path, "w", encoding="utf-8") as cache:
+                json.dump(services, cache)
+        except OSError as exc:
+            self.logger.debug("Unable to save service cache, got %r", exc)
+
+    def _has_state_uuids(self) -> bool:
+        """Return whether the connection has all of the state characteristics"""
+        return set(constants.STATE_UUIDS) <= self._connection.characteristics.keys()
+
+    @classmethod
+    def clear_cache(cls, address: Optional[str] = None) -> None:
+        """Forget the services found for a device, or for every device
+        This takes effect the next time a client is created for the device.
+        """
+        if address is None:
+            paths = glob.glob(os.path.join(_SERVICE_CACHE_DIR, "*.json"))
+        else:
+            paths = [_service_cache_path(address)]
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _cache_characteristics(self) -> None:
+        """Resolve the characteristics we know about once per connection
+        The GATT layout of the Ooler is static, so there's no need to have bleak
+        search its service collection by UUID on every read and write.
+        """
+        connection = self._connection
+        connection.characteristics = {
+            characteristic.uuid: characteristic
+            for characteristic in self.client.services.characteristics.values()
+            if characteristic.uuid in constants.ALL_UUIDS
+        }
+        # Skip waiting for an acknowledgement wherever the device allows it
+        connection.write_needs_response = {
+            uuid: "write-without-response" not in characteristic.properties
+            for uuid, characteristic in connection.characteristics.items()
+        }
+
+    async def _start_notifications(self) -> None:
+        """Subscribe to the state characteristics that support notifications
+        Their latest values then land in the value cache without us asking.
+        Characteristics that can neither notify nor indicate are left to polling.
+        """
+        for uuid in constants.STATE_UUIDS:
+            characteristic = self._connection.characteristics.get(uuid)
+            if characteristic is None or not (
+                {"notify", "indicate"} & set(characteristic.properties)
+            ):
+                continue
+            try:
+                await self.client.start_notify(characteristic, self._on_notify)
+                self._connection.notifying.add(uuid)
+            except BleakError as exc:
+                self.logger.warning("Failed to subscribe to %s, got %r", uuid, exc)
+
+    def _on_notify(self, characteristic, data: bytearray) -> None:
+        """Store a notified value"""
+        connection = self._connection
+        connection.value_cache[characteristic.uuid] = (time.monotonic(), bytes(data))
+        connection.last_written.pop(characteristic.uuid, None)
+
+    def _characteristic(self, uuid: str):
+        """Return the cached characteristic for a UUID, or the UUID if unknown"""
+        return self._connection.characteristics.get(uuid, uuid)
+
+    def _backoff_delay(self, attempt: int) -> float:
+        """How long to wait before retrying, backing off exponentially with jitter"""
+        delay = min(
+            self.max_retry_interval, self.connection_retry_interval * 2**attempt
+        )
+        return delay * random.uniform(0.5, 1.5)
+
+    async def _retry(self, coro_factory, *, deadline_s: float):
+        """Await coro_factory(), retrying on EOFError until deadline_s has passed
+        Each attempt is also bounded by the time remaining, so a hung operation
+        can't hold us past the deadline. Running out of time raises a
+        ConnectionError, so callers find out straight away. Any other link error
+        will have dropped the connection, so that gets one more go on a new one.
+        """
+        deadline = time.monotonic() + deadline_s
+        attempt = 0
+        reconnected = False
+        last_error = None
+        while time.monotonic() < deadline:
+            try:
+                return await asyncio.wait_for(
+                    self._with_disconnect_on_error(coro_factory),
+                    timeout=deadline - time.monotonic(),
+                )
+            except (EOFError, asyncio.TimeoutError) as exc:
+                last_error = exc
+                delay = self._backoff_delay(attempt)
                 attempt = attempt + 1
-
-            if not self.client.is_connected:
-                raise ConnectionError("Failed to connect to Ooler")
+                if time.monotonic() + delay >= deadline:
+                    break
+                self.logger.warning(
+                    "Got %r. Attempt number %d, retrying in %.1fs.",
+                    exc,
+                    attempt,
+                    delay,
+                )
+                await asyncio.sleep(delay)
+            except ConnectionError:
+                # connect() has already made all of its attempts
+                raise
+            except (BleakError, OSError) as exc:
+                if reconnected or not _is_link_error(exc):
+                    raise
+                reconnected = True
+                last_error = exc
+
+        raise ConnectionError(
+            f"Failed to communicate with Ooler after {attempt} attempts"
+        ) from last_error
+
+    async def _with_disconnect_on_error(self, coro_factory):
+        """Await coro_factory(), dropping the connection if the link fails
+        Otherwise a half-open connection can wedge every operation after it,
+        whereas this way the next one starts from a clean session. Requests the
+        device turns down leave the connection alone.
+        """
+        await self.connect()
+        drops = self._connection.drops
+        try:
+            return await coro_factory()
+        except (BleakError, OSError) as exc:
+            if not _is_link_error(exc):
+                raise
+            self.logger.warning("Got %r, dropping the connection", exc)
+            try:
+                await self._drop_connection(drops)
+            except BleakError as disconnect_exc:
+                self.logger.warning("Failed to disconnect, got %r", disconnect_exc)
+            raise
 
     async def _request_characteristic(self, uuid: str) -> bytes:
         """Request a characteristic, handling connections and the like"""
-        for attempt in range(self.max_connection_attempts):
-            try:
-                if not self.client.is_connected:
-                    await self.connect()
+        connection = self._connection
+        cached = connection.value_cache.get(uuid)
+        # Notified values are kept up to date for us, for as long as we're connected
+        if cached is not None and (
+            (uuid in connection.notifying and self.client.is_connected)
+            or self._is_fresh(cached[0], uuid)
+        ):
+            return cached[1]
+
+        # If someone is already reading this, wait for their answer rather than
+        # asking again
+        reader = connection.pending_reads.get(uuid)
+        if reader is None:
+            reader = _shared_task(self._read_characteristic(uuid))
+            connection.pending_reads[uuid] = reader
+            reader.add_done_callback(functools.partial(self._read_done, uuid))
+        return await asyncio.shield(reader)
+
+    def _read_done(self, uuid: str, reader: asyncio.Task) -> None:
+        """Clean up after a shared read has finished"""
+        # A write may have already replaced us with a newer read
+        if self._connection.pending_reads.get(uuid) is reader:
+            del self._connection.pending_reads[uuid]
+
+    async def _read_characteristic(self, uuid: str) -> bytes:
+        """Read a characteristic from the device, and cache the result"""
+
+        async def read() -> bytes:
+            return bytes(await self.client.read_gatt_char(self._characteristic(uuid)))
+
+        connection = self._connection
+        writes = connection.writes.get(uuid, 0)
+        self._begin_operation()
+        try:
+            value = await self._retry(read, deadline_s=self.retry_deadline)
+        finally:
+            self._end_operation()
+        # If it was written while we were reading, what we read may be stale
+        if connection.writes.get(uuid, 0) == writes:
+            connection.value_cache[uuid] = (time.monotonic(), value)
+            # We know the real value now, so don't trust what we last wrote instead
+            connection.last_written.pop(uuid, None)
 
-                value = await self.client.read_gatt_char(uuid)
-                break
-            except EOFError as exc:
-                self.logger.warning(f"Got EOFError {exc}. Attempt number {attempt}.")
-                await asyncio.sleep(self.connection_retry_interval)
+        return value
 
-        if not self.stay_connected:
-            await self.disconnect()
+    async def _write_characteristic(
+        self, uuid: str, data: bytes, confirm: bool = False
+    ) -> None:
+        """Write a characteristic, handling connections and the like
+        Writing the same value again while the last write is still fresh is
+        skipped, so repeated commands don't each cost a round-trip. Writes aren't
+        acknowledged where the device allows it, unless confirm is set.
+        """
+        last_written = self._connection.last_written.get(uuid)
+        if (
+            last_written is not None
+            and last_written[1] == data
+            and self._is_fresh(last_written[0], uuid)
+        ):
+            return
 
-        return value
+        async def write() -> None:
+            await self.client.write_gatt_char(
+                self._characteristic(uuid),
+                data,
+                response=self._write_response(uuid, confirm),
+            )
 
-    async def _write_characteristic(self, uuid: str, data: bytes) -> bytes:
-        """Write a characteristic, handling connections and the like"""
-        for attempt in range(self.max_connection_attempts):
-            try:
-                if not self.client.is_connected:
-                    await self.connect()
+        self._begin_operation()
+        try:
+            await self._retry(write, deadline_s=self.retry_deadline)
+        finally:
+            self._end_operation()
+        self._invalidate(uuid)
+        self._connection.last_written[uuid] = (time.monotonic(), bytes(data))
+
+    def _write_response(self, uuid: str, confirm: bool) -> bool:
+        """Return whether a write needs to wait for the device to acknowledge it"""
+        connection = self._connection
+        if connection.write_needs_response.get(uuid, True):
+            return True
+        return confirm and "write" in connection.characteristics[uuid].properties
+
+    def _is_fresh(self, timestamp: float, uuid: str) -> bool:
+        """Return whether something cached for a characteristic is still valid"""
+        return time.monotonic() - timestamp < _CACHE_TTL.get(uuid, self.cache_ttl)
+
+    def _begin_operation(self) -> None:
+        """Note that an operation has started, so we don't go idle under it"""
+        connection = self._connection
+        connection.in_flight += 1
+        if connection.idle_handle is not None:
+            connection.idle_handle.cancel()
+            connection.idle_handle = None
+
+    def _end_operation(self) -> None:
+        """Note that an operation has finished, going idle if it was the last"""
+        self._connection.in_flight -= 1
+        if self._connection.in_flight == 0:
+            self._arm_idle()
+
+    def _arm_idle(self) -> None:
+        """(Re)start the countdown to disconnecting once we've gone idle
+        This is a no-op if we're meant to stay connected. An idle_timeout of 0
+        disconnects straight after every operation.
+        """
+        if self.stay_connected:
+            return
+        connection = self._connection
+        if connection.idle_handle is not None:
+            connection.idle_handle.cancel()
+            connection.idle_handle = None
+        if self.idle_timeout <= 0:
+            self._idle_expired()
+            return
+        connection.idle_handle = asyncio.get_running_loop().call_later(
+            self.idle_timeout, self._idle_expired
+        )
 
-                await self.client.write_gatt_char(uuid, data)
-                break
-            except EOFError as exc:
-                self.logger.warning(f"Got EOFError {exc}. Attempt number {attempt}.")
-                await asyncio.sleep(self.connection_retry_interval)
+    def _idle_expired(self) -> None:
+        """Disconnect after being idle for idle_timeout seconds"""
+        connection = self._connection
+        connection.idle_handle = None
+        connection.idle_disconnect = asyncio.create_task(self._disconnect_idle())
 
-        if not self.stay_connected:
+    async def _disconnect_idle(self) -> None:
+        """Disconnect, unless an operation has started since we went idle"""
+        if self._connection.in_flight:
+            return
+        try:
             await self.disconnect()
+        except BleakError as exc:
+            self.logger.warning("Failed to disconnect, got %r", exc)
+
+    def _invalidate(self, uuid: str) -> None:
+        """Drop cached values that a write to a characteristic makes stale
+        Reads already under way are forgotten too, so anyone asking from now on
+        gets a value read after the write.
+        """
+        connection = self._connection
+        for stale in (uuid, *_INVALIDATES.get(uuid, ())):
+            connection.value_cache.pop(stale, None)
+            connection.pending_reads.pop(stale, None)
+            connection.writes[stale] = connection.writes.get(stale, 0) + 1
 
     async def disconnect(self) -> None:
-        """Disconnect from the Ooler"""
+        """Disconnect from the Ooler, unless an async with block still holds it open
+        Only async with blocks hold the link open. Leaving the last one, or
+        calling this outside of one, disconnects every instance for the device,
+        including any that stay_connected; those reconnect when next used.
+        """
+        if self._connection.refcount > 0:
+            return
+        await self._drop_connection()
+
+    async def _drop_connection(self, drops: Optional[int] = None) -> None:
+        """Disconnect and forget everything we knew about the connection
+        Given how many drops there had been when an operation started, this
+        leaves alone a connection that has been dropped since, so a burst of
+        failures on one connection only drops it once. Concurrent callers all
+        wait on the same drop.
+        """
+        connection = self._connection
+        if drops is not None and drops != connection.drops:
+            return
+        if connection.dropper is None or connection.dropper.done():
+            connection.drops += 1
+            connection.dropper = _shared_task(self._disconnect_client())
+        await asyncio.shield(connection.dropper)
+
+    async def _disconnect_client(self) -> None:
+        """Forget the state of the connection, then disconnect the client"""
+        connection = self._connection
+        if connection.idle_handle is not None:
+            connection.idle_handle.cancel()
+            connection.idle_handle = None
+        connection.reset()
         await self.client.disconnect()
 
-    @staticmethod
-    def _f_to_c(deg_f: int) -> int:
-        """Convert Fahrenheit to Celsius, integer"""
-        c_float = (deg_f - 32) / 1.8
-        return round(c_float)
-
-    @staticmethod
-    def _c_to_f(deg_c: int) -> int:
-        """Convert Celsius to Fahrenheit, integer"""
-        f_float = (deg_c * 1.8) + 32
-        return round(f_float)
-
     async def set_current_time(self, tz: str) -> None:
         """Set the current time and time zone offset on the Ooler"""
         # Documentation for these characteristics is weirdly hard to find for some
         # reason, unless that's just me, but I'll document them here
         curtime = datetime.now(tz=ZoneInfo(tz))
 
-        # First the Current Time Service, which is fairly self-explanatory from the code
-        time_data = bytearray()
-        time_data.extend(curtime.year.to_bytes(2, byteorder="little"))
-        time_data.append(curtime.month)
-        time_data.append(curtime.day)
-        time_data.append(curtime.hour)
-        time_data.append(curtime.minute)
-        time_data.append(curtime.second)
-        time_data.append(curtime.isoweekday())
-        # This is meant to be 256ths of a second, but I think we really don't care
-        time_data.append(0)
-        # And now we lie in our reason why we're updating; this is a bitfield:
-        # - Manual time update?
-        # - External reference time update?
-        # - Time zone change?
-        # - DST change:
-        # We'll just say it's a reference time update and nothing else.
-        time_data.append(2)
-        await self._write_characteristic(constants.CURRENT_TIME, time_data)
+        # First the Current Time Service, which is fairly self-explanatory from the
+        # code: a little-endian year, then a byte each for month, day, hour, minute,
+        # second and day of the week.
+        time_data = struct.pack(
+            "<HBBBBBBBB",
+            curtime.year,
+            curtime.month,
+            curtime.day,
+            curtime.hour,
+            curtime.minute,
+            curtime.second,
+            curtime.isoweekday(),
+            # This is meant to be 256ths of a second, but I think we really don't
+            # care
+            0,
+            # And now we lie in our reason why we're updating; this is a bitfield:
+            # - Manual time update?
+            # - External reference time update?
+            # - Time zone change?
+            # - DST change:
+            # We'll just say it's a reference time update and nothing else.
+            2,
+        )
 
         # Next is Local Time Information, which is a bit weirder.
-        local_data = bytearray()
-        # Offsets are in multiples of 15 minutes
-        offset = int(curtime.utcoffset().seconds/60/15)
-        if curtime.utcoffset().days == -1:
-            offset = (24 * 4) - offset
-        local_data.append(offset)
-        # And finally the DST offset, which is also calculated in 15 minute intervals
-        local_data.append(int(curtime.dst().seconds/60/15))
-        await self._write_characteristic(constants.LOCAL_TIME, local_data)
-
-    async def get_actual_temperature_raw(self) -> int:
-        """Get the current tempterature in whatever the Ooler is configured for"""
-        return int.from_bytes(
-            await self._request_characteristic(constants.ACTUAL_TEMP), byteorder="big"
+        # Offsets are in multiples of 15 minutes, and the time zone is signed
+        offset = curtime.utcoffset() // timedelta(minutes=15)
+        # And finally the DST offset, which is also calculated in 15 minute intervals.
+        # This can be negative too, e.g. Europe/Dublin observes it in winter.
+        dst = curtime.dst() // timedelta(minutes=15)
+        local_data = bytes((offset & 0xFF, dst & 0xFF))
+
+        # The two are independent, so send them together. This is only done once
+        # in a while, so we may as well make sure they arrive.
+        await asyncio.gather(
+            self._write_characteristic(constants.CURRENT_TIME, time_data, confirm=True),
+            self._write_characteristic(constants.LOCAL_TIME, local_data, confirm=True),
         )
 
+    async def get_state(self) -> Dict[str, int]:
+        """Read all of the state characteristics concurrently
+        Values are returned undecoded by unit, keyed by UUID, so the actual
+        temperature is in whatever the Ooler is configured for. The values are
+        cached as they're read, so the individual getters can follow on for free.
+        """
+        values = await asyncio.gather(
+            *[self._request_characteristic(uuid) for uuid in constants.STATE_UUIDS]
+        )
+        return {
+            uuid: _u8(value)
+            for uuid, value in zip(constants.STATE_UUIDS, values)
+        }
+
+    get_actual_temperature_raw = _u8_getter(
+        "get_actual_temperature_raw",
+        constants.ACTUAL_TEMP,
+        "Get the current tempterature in whatever the Ooler is configured for",
+    )
+
+    async def _get_actual_temperature(self) -> Tuple[constants.TemperatureUnit, int]:
+        """Get the current temperature along with the unit it is in
+        If we don't know the unit yet, both are read at the same time.
+        """
+        if self.device_temperature_unit is None:
+            return await asyncio.gather(
+                self.get_temperature_unit(), self.get_actual_temperature_raw()
+            )
+        return self.device_temperature_unit, await self.get_actual_temperature_raw()
+
     async def get_actual_temperature_f(self) -> int:
         """Get the current tempterature in Fahrenheit"""
-        if await self.get_temperature_unit() == constants.TemperatureUnit.Celsius:
-            return self._c_to_f(await self.get_actual_temperature_raw())
-        return await self.get_actual_temperature_raw()
+        unit, temperature = await self._get_actual_temperature()
+        if unit == constants.TemperatureUnit.Celsius:
+            return _c_to_f(temperature)
+        return temperature
 
     async def get_actual_temperature_c(self) -> int:
         """Get the current tempterature in Celsius"""
-        if await self.get_temperature_unit() == constants.TemperatureUnit.Fahrenheit:
-            return self._f_to_c(await self.get_actual_temperature_raw())
-        return await self.get_actual_temperature_raw()
-
-    async def get_desired_temperature_f(self) -> int:
-        """Get the desired tempterature in Fahrenheit"""
-        return int.from_bytes(
-            await self._request_characteristic(constants.TARGET_TEMP_F), byteorder="big"
-        )
+        unit, temperature = await self._get_actual_temperature()
+        if unit == constants.TemperatureUnit.Fahrenheit:
+            return _f_to_c(temperature)
+        return temperature
+
+    get_desired_temperature_f = _u8_getter(
+        "get_desired_temperature_f",
+        constants.TARGET_TEMP_F,
+        "Get the desired tempterature in Fahrenheit",
+    )
 
     async def set_desired_temperature_f(self, deg_f: int) -> None:
         """Set the desired tempterature in Fahrenheit"""
-        await self._write_characteristic(
-            constants.TARGET_TEMP_F, deg_f.to_bytes(1, byteorder="big")
-        )
+        await self._write_characteristic(constants.TARGET_TEMP_F, bytes((deg_f,)))
 
     async def get_desired_temperature_c(self) -> int:
         """Get the desired tempterature in Celsius"""
-        return self._f_to_c(await self.get_desired_temperature_f())
+        return _f_to_c(await self.get_desired_temperature_f())
 
     async def set_desired_temperature_c(self, deg_c: int) -> None:
         """Set the desired tempterature in Celsius"""
-        await self.set_desired_temperature_f(self._c_to_f(deg_c))
+        await self.set_desired_temperature_f(_c_to_f(deg_c))
 
     async def powered_on(self) -> bool:
         """Return the power state of the Ooler"""
-        return await self._request_characteristic(constants.POWER_STATUS) == b"\x01"
+        return (await self._request_characteristic(constants.POWER_STATUS))[0] == 1
 
     async def set_power_state(self, value: bool) -> None:
         """Turn the Ooler on or off"""
         await self._write_characteristic(
-            constants.POWER_STATUS, value.to_bytes(1, byteorder="big")
+            constants.POWER_STATUS, constants.BOOL_PAYLOAD[value]
         )
 
     async def get_temperature_unit(self) -> constants.TemperatureUnit:
         """Return the temperature unit of the Ooler"""
         if self.device_temperature_unit is None:
             unit = await self._request_characteristic(constants.DISPLAY_TEMPERATURE_UNIT)
-            self.device_temperature_unit = constants.TemperatureUnit(
-                int.from_bytes(unit, byteorder="big")
-            )
+            self.device_temperature_unit = constants.TemperatureUnit(_u8(unit))
         return self.device_temperature_unit
 
     async def set_temperature_unit(self, unit: constants.TemperatureUnit):
         await self._write_characteristic(
-            constants.DISPLAY_TEMPERATURE_UNIT, unit.value.to_bytes(1, byteorder="big"))
-        # Refresh the cached value
-        self.device_temperature_unit = None
-        await self.get_temperature_unit()
+            constants.DISPLAY_TEMPERATURE_UNIT,
+            constants.TEMPERATURE_UNIT_PAYLOAD[unit],
+        )
+        # We know what the unit is now, so there's no need to read it back
+        self.device_temperature_unit = unit
 
     async def get_fan_speed(self) -> constants.FanSpeed:
         """Return the fan mode of the Ooler"""
         speed = await self._request_characteristic(constants.FAN_SPEED)
-        return constants.FanSpeed(int.from_bytes(speed, byteorder="big"))
+        return constants.FanSpeed(_u8(speed))
 
     async def set_fan_speed(self, speed: constants.FanSpeed) -> None:
         """Return the fan mode of the Ooler"""
         await self._write_characteristic(
-            constants.FAN_SPEED, speed.value.to_bytes(1, byteorder="big")
+            constants.FAN_SPEED, constants.FAN_SPEED_PAYLOAD[speed]
         )
 
-    async def get_water_level(self) -> int:
-        """Return the water level of the Ooler"""
-        return int.from_bytes(
-            await self._request_characteristic(constants.WATER_LEVEL), byteorder="big"
-        )
+    get_water_level = _u8_getter(
+        "get_water_level", constants.WATER_LEVEL, "Return the water level of the Ooler"
+    )
 
-    async def get_pump_wattage(self) -> int:
-        """Return the wattage of the pump"""
-        return int.from_bytes(
-            await self._request_characteristic(constants.PUMP_WATTS), byteorder="big"
-        )
+    get_pump_wattage = _u8_getter(
+        "get_pump_wattage", constants.PUMP_WATTS, "Return the wattage of the pump"
+    )
 
-    async def get_pump_voltage(self) -> int:
-        """Return the volttage of the pump"""
-        return int.from_bytes(
-            await self._request_characteristic(constants.PUMP_VOLTS), byteorder="big"
-        )
+    get_pump_voltage = _u8_getter(
+        "get_pump_voltage", constants.PUMP_VOLTS, "Return the volttage of the pump"
+    )
 
     async def is_cleaning(self) -> bool:
         """Return whether the device is cleaning itself"""
-        return await self._request_characteristic(constants.CLEAN) == b"\x01"
+        return (await self._request_characteristic(constants.CLEAN))[0] == 1
 
     async def set_cleaning(self, value: bool) -> None:
         """Tell the device to clean"""
         await self._write_characteristic(
-            constants.CLEAN, value.to_bytes(1, byteorder="big")
+            constants.CLEAN, constants.BOOL_PAYLOAD[value]
         )
 
     async def get_name(self) -> str:
         """Get the name of the Ooler"""
-        return (await self._request_characteristic(constants.NAME)).decode(
-            encoding="ascii"
-        )
+        # This won't change under us, so only read it once
+        if self.device_name is None:
+            self.device_name = (
+                await self._request_characteristic(constants.NAME)
+            ).decode(encoding="ascii")
+        return self.device_name
@@ -0,0 +1,365 @@
+"""Tests for the Ooler client that don't need a device"""
+import asyncio
+import gc
+import tempfile
+import unittest
+from datetime import datetime
+from unittest import mock
+from zoneinfo import ZoneInfo
+
+from bleak import BleakError
+from bleak.exc import BleakCharacteristicNotFoundError, BleakDBusError
+
+from ooler import constants, ooler
+from ooler.ooler import Ooler
+
+ADDRESS = "00:00:00:00:00:00"
+SERVICE = "0000180a-0000-1000-8000-00805f9b34fb"
+
+
+class FakeCharacteristic:
+    """Just enough of a BleakGATTCharacteristic"""
+
+    def __init__(self, uuid: str):
+        self.uuid = uuid
+        self.service_uuid = SERVICE
+        self.properties = ["read", "write"]
+
+
+class FakeServices:
+    """Just enough of a BleakGATTServiceCollection"""
+
+    def __init__(self, uuids):
+        self.characteristics = dict(enumerate(map(FakeCharacteristic, uuids)))
+
+
+class FakeClient:
+    """A BleakClient for a device holding one byte in every characteristic"""
+
+    uuids = constants.ALL_UUIDS
+    notify_uuids = frozenset()
+
+    def __init__(self, address, services=None, disconnected_callback=None):
+        self.address = address
+        self.is_connected = False
+        # Everything is in one service, so a filter without it finds nothing
+        if services is None or SERVICE in services:
+            self.services = FakeServices(self.uuids)
+        else:
+            self.services = FakeServices(())
+        for characteristic in self.services.characteristics.values():
+            if characteristic.uuid in self.notify_uuids:
+                characteristic.properties.append("notify")
+        self.notify_callbacks = {}
+        self.values = {uuid: b"\x01" for uuid in constants.ALL_UUIDS}
+        self.connects = 0
+        self.disconnects = 0
+        self.connect_error = None
+        self.connect_delay = 0
+        self.disconnect_delay = 0
+        self.read_errors = []
+        self.read_delay = 0
+        self.reads = 0
+        self.disconnected_callback = disconnected_callback
+
+    async def connect(self):
+        self.connects += 1
+        await asyncio.sleep(self.connect_delay)
+        if self.connect_error is not None:
+            raise self.connect_error
+        self.is_connected = True
+
+    async def disconnect(self):
+        self.disconnects += 1
+        await asyncio.sleep(self.disconnect_delay)
+        self.is_connected = False
+        self.disconnected_callback(self)
+
+    async def read_gatt_char(self, characteristic):
+        if isinstance(characteristic, str):
+            raise BleakCharacteristicNotFoundError(characteristic)
+        if not self.is_connected:
+            raise BleakError("Not connected")
+        if self.read_errors:
+            raise self.read_errors.pop(0)
+        # Answer with the value from when the read was asked for, staggering
+        # concurrent reads so that they finish one at a time
+        value = bytearray(self.values[characteristic.uuid])
+        self.reads += 1
+        await asyncio.sleep(self.read_delay * (self.reads % 4 + 1))
+        if not self.is_connected:
+            raise BleakError("Not connected")
+        return value
+
+    async def write_gatt_char(self, characteristic, data, response=None):
+        self.values[characteristic.uuid] = bytes(data)
+
+    async def start_notify(self, characteristic, callback):
+        self.notify_callbacks[characteristic.uuid] = (characteristic, callback)
+
+    def notify(self, uuid: str, value: bytes) -> None:
+        characteristic, callback = self.notify_callbacks[uuid]
+        callback(characteristic, bytearray(value))
+
+    def drop_link(self) -> None:
+        """Lose the connection without being asked to"""
+        self.is_connected = False
+        self.disconnected_callback(self)
+
+
+class FakeClientTestCase(unittest.IsolatedAsyncioTestCase):
+    """Run against a FakeClient, with no service cache on disk"""
+
+    def setUp(self):
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        patches = (
+            mock.patch.object(ooler, "BleakClient", FakeClient),
+            mock.patch.object(ooler, "_SERVICE_CACHE_DIR", cache_dir.name),
+            mock.patch.object(Ooler, "_load_services", lambda self: None),
+            mock.patch.object(ooler.random, "uniform", lambda a, b: 0),
+        )
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.addCleanup(Ooler._connections.clear)
+
+    def make_ooler(self, **kwargs) -> Ooler:
+        return Ooler(address=ADDRESS, **kwargs)
+
+
+class LinkErrorTest(unittest.TestCase):
+    def test_link_errors(self):
+        self.assertTrue(ooler._is_link_error(BleakError("Not connected")))
+        self.assertTrue(ooler._is_link_error(EOFError()))
+        self.assertTrue(
+            ooler._is_link_error(
+                BleakDBusError("org.bluez.Error.Failed", ["Not connected"])
+            )
+        )
+
+    def test_request_errors(self):
+        self.assertFalse(
+            ooler._is_link_error(BleakCharacteristicNotFoundError(constants.NAME))
+        )
+        self.assertFalse(
+            ooler._is_link_error(BleakDBusError("org.bluez.Error.NotPermitted", []))
+        )
+        self.assertFalse(
+            ooler._is_link_error(
+                BleakDBusError(
+                    "org.bluez.Error.Failed",
+                    ["Operation failed with ATT error: 0x0e"],
+                )
+            )
+        )
+
+
+class RetryTest(FakeClientTestCase):
+    async def test_connect_attempts_are_not_repeated(self):
+        device = self.make_ooler(max_connection_attempts=3)
+        device.client.connect_error = BleakError("Device not found")
+        with self.assertRaises(ConnectionError):
+            await device.get_water_level()
+        self.assertEqual(device.client.connects, 3)
+
+    async def test_link_error_reconnects(self):
+        device = self.make_ooler()
+        await device.connect()
+        device.client.read_errors.append(BleakError("Not connected"))
+        self.assertEqual(await device.get_water_level(), 1)
+        self.assertEqual(device.client.disconnects, 1)
+        self.assertEqual(device.client.connects, 2)
+
+    async def test_missing_characteristic_keeps_connection(self):
+        uuids = constants.ALL_UUIDS - {constants.NAME}
+        with mock.patch.object(FakeClient, "uuids", uuids):
+            device = self.make_ooler()
+            with self.assertRaises(BleakCharacteristicNotFoundError):
+                await device.get_name()
+        self.assertEqual(device.client.disconnects, 0)
+        self.assertEqual(device.client.connects, 1)
+
+
+class ConversionTest(unittest.TestCase):
+    """The integer conversions agree with the float formulas they replaced"""
+
+    def test_f_to_c(self):
+        for deg_f in range(0, 111):
+            with self.subTest(deg_f=deg_f):
+                expected = round((deg_f - 32) / 1.8)
+                self.assertEqual(ooler._f_to_c_exact(deg_f), expected)
+                self.assertEqual(ooler._f_to_c(deg_f), expected)
+
+    def test_c_to_f(self):
+        for deg_c in range(ooler._f_to_c(0), ooler._f_to_c(110) + 1):
+            with self.subTest(deg_c=deg_c):
+                expected = round(deg_c * 1.8 + 32)
+                self.assertEqual(ooler._c_to_f_exact(deg_c), expected)
+                self.assertEqual(ooler._c_to_f(deg_c), expected)
+
+
+class _FixedDatetime(datetime):
+    """A datetime whose now() is always midday on 2026-01-15"""
+
+    @classmethod
+    def now(cls, tz=None):
+        return cls(2026, 1, 15, 12, 0, tzinfo=tz)
+
+
+class SetCurrentTimeTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.ooler = Ooler(address="00:00:00:00:00:00")
+        self.writes = {}
+
+        async def write(uuid, data, confirm=False):
+            self.writes[uuid] = data
+
+        self.ooler._write_characteristic = write
+
+    def tearDown(self):
+        Ooler._connections.clear()
+
+    async def local_time(self, tz: str) -> bytes:
+        with mock.patch.object(ooler, "datetime", _FixedDatetime):
+            await self.ooler.set_current_time(tz)
+        return self.writes[constants.LOCAL_TIME]
+
+    async def test_negative_utc_offset(self):
+        self.assertEqual(await self.local_time("America/New_York"), b"\xec\x00")
+
+    async def test_negative_dst_offset(self):
+        # Irish Standard Time is summer time, so winter has a DST offset of -1h
+        self.assertEqual(
+            _FixedDatetime.now(ZoneInfo("Europe/Dublin")).dst().total_seconds(),
+            -3600,
+        )
+        self.assertEqual(await self.local_time("Europe/Dublin"), b"\x00\xfc")
+
+
+class PoolTest(FakeClientTestCase):
+    async def test_instances_share_a_connection(self):
+        first = self.make_ooler()
+        second = self.make_ooler()
+        self.assertIs(first.client, second.client)
+        await first.get_water_level()
+        first.client.values[constants.WATER_LEVEL] = b"\x02"
+        self.assertEqual(await second.get_water_level(), 1)
+
+    async def test_async_with_holds_the_link_open(self):
+        outer = self.make_ooler(stay_connected=False)
+        inner = self.make_ooler(stay_connected=False)
+        async with outer:
+            async with inner:
+                pass
+            self.assertTrue(outer.client.is_connected)
+        self.assertFalse(outer.client.is_connected)
+
+    async def test_leaving_async_with_disconnects_everyone(self):
+        bridge = self.make_ooler(stay_connected=True)
+        await bridge.get_water_level()
+        async with self.make_ooler():
+            pass
+        self.assertFalse(bridge.client.is_connected)
+        self.assertEqual(await bridge.get_pump_wattage(), 1)
+        self.assertTrue(bridge.client.is_connected)
+
+    async def test_unused_connections_are_forgotten(self):
+        device = self.make_ooler()
+        await device.get_water_level()
+        await device.disconnect()
+        del device
+        gc.collect()
+        self.assertNotIn(ADDRESS, Ooler._connections)
+
+
+class IdleTest(FakeClientTestCase):
+    async def test_no_disconnect_under_concurrent_reads(self):
+        device = self.make_ooler(stay_connected=False, idle_timeout=0, cache_ttl=0)
+        device.client.read_delay = 0.01
+        with self.assertNoLogs("ooler.ooler", "WARNING"):
+            for _ in range(3):
+                state = await device.get_state()
+                self.assertEqual(set(state.values()), {1})
+        await device._connection.idle_disconnect
+        self.assertFalse(device.client.is_connected)
+        self.assertEqual(device._connection.in_flight, 0)
+
+
+class CacheTest(FakeClientTestCase):
+    async def test_read_from_before_a_write_is_not_reused(self):
+        device = self.make_ooler(cache_ttl=10)
+        await device.connect()
+        device.client.read_delay = 0.01
+        before = asyncio.create_task(device.get_fan_speed())
+        while not device.client.reads:
+            await asyncio.sleep(0)
+        await device.set_fan_speed(constants.FanSpeed.Boost)
+        self.assertEqual(await device.get_fan_speed(), constants.FanSpeed.Boost)
+        self.assertEqual(await before, constants.FanSpeed.Regular)
+        self.assertEqual(await device.get_fan_speed(), constants.FanSpeed.Boost)
+
+
+class NotifyTest(FakeClientTestCase):
+    def setUp(self):
+        super().setUp()
+        uuids = frozenset({constants.ACTUAL_TEMP})
+        patch = mock.patch.object(FakeClient, "notify_uuids", uuids)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    async def test_notified_values_are_used(self):
+        device = self.make_ooler(cache_ttl=0)
+        self.assertEqual(await device.get_actual_temperature_raw(), 1)
+        device.client.notify(constants.ACTUAL_TEMP, b"\x45")
+        reads = device.client.reads
+        self.assertEqual(await device.get_actual_temperature_raw(), 0x45)
+        self.assertEqual(device.client.reads, reads)
+
+    async def test_notified_values_are_dropped_with_the_link(self):
+        device = self.make_ooler(cache_ttl=0)
+        await device.get_actual_temperature_raw()
+        device.client.notify(constants.ACTUAL_TEMP, b"\x45")
+        device.client.drop_link()
+        self.assertEqual(await device.get_actual_temperature_raw(), 1)
+        self.assertTrue(device.client.is_connected)
+        self.assertEqual(device.client.connects, 2)
+
+
+class ServiceCacheTest(FakeClientTestCase):
+    async def test_stale_cache_is_rediscovered_under_operations(self):
+        stale = ["0000dead-0000-1000-8000-00805f9b34fb"]
+        with mock.patch.object(Ooler, "_load_services", lambda self: stale):
+            device = self.make_ooler()
+        stale_client = device.client
+        stale_client.disconnect_delay = 0.01
+        connecting = asyncio.create_task(device.connect())
+        # Get a read in while the stale client is connected, but being replaced
+        while not stale_client.is_connected:
+            await asyncio.sleep(0)
+        self.assertEqual(await device.get_water_level(), 1)
+        await connecting
+        self.assertIsNot(device.client, stale_client)
+        self.assertTrue(device.client.is_connected)
+        self.assertEqual(device.client.disconnects, 0)
+
+
+class SharedTaskTest(FakeClientTestCase):
+    async def test_abandoned_connect_failure_is_retrieved(self):
+        errors = []
+        loop = asyncio.get_running_loop()
+        loop.set_exception_handler(lambda loop, context: errors.append(context))
+        device = self.make_ooler(max_connection_attempts=1)
+        device.client.connect_delay = 0.01
+        device.client.connect_error = BleakError("Device not found")
+        with self.assertRaises(asyncio.TimeoutError):
+            await asyncio.wait_for(device.connect(), 0.001)
+        await asyncio.sleep(0.02)
+        del device
+        Ooler._connections.clear()
+        gc.collect()
+        self.assertEqual(errors, [])
+
+
+if __name__ == "__main__":
+    unittest.main()